@@ -438,10 +438,20 @@ d = { 'settings': { 'branch': 'main',
                                                                                                             'neuralforecast/models/tft.py'),
                                            'neuralforecast.models.tft.VariableSelectionNetwork.forward': ( 'models.tft.html#variableselectionnetwork.forward',
                                                                                                            'neuralforecast/models/tft.py')},
-            'neuralforecast.tsdataset': { 'neuralforecast.tsdataset.TimeSeriesDataModule': ( 'tsdataset.html#timeseriesdatamodule',
+            'neuralforecast.tsdataset': { 'neuralforecast.tsdataset.LengthBucketSampler': ( 'tsdataset.html#lengthbucketsampler',
+                                                                                            'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.LengthBucketSampler.__init__': ( 'tsdataset.html#lengthbucketsampler.__init__',
+                                                                                                     'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.LengthBucketSampler.__iter__': ( 'tsdataset.html#lengthbucketsampler.__iter__',
+                                                                                                     'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.LengthBucketSampler.__len__': ( 'tsdataset.html#lengthbucketsampler.__len__',
+                                                                                                    'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.TimeSeriesDataModule': ( 'tsdataset.html#timeseriesdatamodule',
                                                                                              'neuralforecast/tsdataset.py'),
                                           'neuralforecast.tsdataset.TimeSeriesDataModule.__init__': ( 'tsdataset.html#timeseriesdatamodule.__init__',
                                                                                                       'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.TimeSeriesDataModule._loader_kwargs': ( 'tsdataset.html#timeseriesdatamodule._loader_kwargs',
+                                                                                                            'neuralforecast/tsdataset.py'),
                                           'neuralforecast.tsdataset.TimeSeriesDataModule.predict_dataloader': ( 'tsdataset.html#timeseriesdatamodule.predict_dataloader',
                                                                                                                 'neuralforecast/tsdataset.py'),
                                           'neuralforecast.tsdataset.TimeSeriesDataModule.train_dataloader': ( 'tsdataset.html#timeseriesdatamodule.train_dataloader',
@@ -468,6 +478,20 @@ d = { 'settings': { 'branch': 'main',
                                                                                          'neuralforecast/tsdataset.py'),
                                           'neuralforecast.tsdataset.TimeSeriesLoader.__init__': ( 'tsdataset.html#timeseriesloader.__init__',
                                                                                                   'neuralforecast/tsdataset.py'),
-                                          'neuralforecast.tsdataset.TimeSeriesLoader._collate_fn': ( 'tsdataset.html#timeseriesloader._collate_fn',
-                                                                                                     'neuralforecast/tsdataset.py')},
+                                          'neuralforecast.tsdataset.TimeSeriesLoader._collate_static': ( 'tsdataset.html#timeseriesloader._collate_static',
+                                                                                                         'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.TimeSeriesLoader._collate_temporal': ( 'tsdataset.html#timeseriesloader._collate_temporal',
+                                                                                                           'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.TimeSeriesLoader._empty_batch': ( 'tsdataset.html#timeseriesloader._empty_batch',
+                                                                                                      'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.TimeSeriesLoader._pad_tensors': ( 'tsdataset.html#timeseriesloader._pad_tensors',
+                                                                                                      'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.TimeSeriesLoader._select_collate_fn': ( 'tsdataset.html#timeseriesloader._select_collate_fn',
+                                                                                                            'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset.TimeSeriesLoader._stack_tensors': ( 'tsdataset.html#timeseriesloader._stack_tensors',
+                                                                                                        'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset._pack_padded': ( 'tsdataset.html#_pack_padded',
+                                                                                     'neuralforecast/tsdataset.py'),
+                                          'neuralforecast.tsdataset._round_up': ( 'tsdataset.html#_round_up',
+                                                                                  'neuralforecast/tsdataset.py')},
             'neuralforecast.utils': {'neuralforecast.utils.generate_series': ('utils.html#generate_series', 'neuralforecast/utils.py')}}}
\ No newline at end of file
@@ -1,16 +1,16 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/tsdataset.ipynb.
 
 # %% auto 0
-__all__ = ['TimeSeriesLoader', 'TimeSeriesDataset', 'TimeSeriesDataModule']
+__all__ = ['TimeSeriesLoader', 'TimeSeriesDataset', 'LengthBucketSampler', 'TimeSeriesDataModule']
 
 # %% ../nbs/tsdataset.ipynb 4
-from collections.abc import Mapping
+from collections import namedtuple
 
 import numpy as np
 import pandas as pd
 import pytorch_lightning as pl
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Sampler
 
 # %% ../nbs/tsdataset.ipynb 5
 class TimeSeriesLoader(DataLoader):
@@ -29,40 +29,104 @@ class TimeSeriesLoader(DataLoader):
     `shuffle`: (bool, optional): set to `True` to have the data reshuffled at every epoch (default: `False`).<br>
     `sampler`: (Sampler or Iterable, optional): defines the strategy to draw samples from the dataset.<br>
                 Can be any `Iterable` with `__len__` implemented. If specified, `shuffle` must not be specified.<br>
+    `pad_to_batch_max`: (bool, optional): set to `True` to left-pad each batch only up to its longest serie instead of the dataset's `max_size` (default: `False`).<br>
     """
-    def __init__(self, dataset, **kwargs):
+    def __init__(self, dataset, pad_to_batch_max=False, **kwargs):
         if 'collate_fn' in kwargs:
             kwargs.pop('collate_fn')
-        kwargs_ = {**kwargs, **dict(collate_fn=self._collate_fn)}
+        self.pad_to_batch_max = pad_to_batch_max
+
+        # Items share one schema, pick their collate once instead of per batch.
+        # Empty datasets yield no batches to collate
+        collate_fn = self._select_collate_fn(dataset[0]) if len(dataset) > 0 else None
+
+        kwargs_ = {**kwargs, **dict(collate_fn=collate_fn)}
         DataLoader.__init__(self, dataset=dataset, **kwargs_)
     
-    def _collate_fn(self, batch):
-        elem = batch[0]
+    def _empty_batch(self, elem, size, dtype=None):
+        dtype = elem.dtype if dtype is None else dtype
+        if torch.utils.data.get_worker_info() is not None:
+            # If we're in a background process, collate directly into a
+            # shared memory tensor to avoid an extra copy
+            numel = int(np.prod(size))
+            out = elem.new_empty(0, dtype=dtype)
+            storage = out.storage()._new_shared(numel, device=elem.device)
+            return out.new(storage).resize_(*size)
+        return elem.new_empty(size, dtype=dtype)
+
+    def _stack_tensors(self, batch):
+        # Stacked samples share their shape, so the batch size needs no pass over it
+        out = self._empty_batch(batch[0], (len(batch), *batch[0].size()))
+        return torch.stack(batch, 0, out=out)
+
+    def _pad_tensors(self, batch):
+        # Pad raw series [C, size] to the left up to the dataset's max_size,
+        # or up to the longest serie of the batch
+        sizes = np.array([t.shape[-1] for t in batch])
+        max_size = self.dataset.max_size
+        if self.pad_to_batch_max:
+            max_size = _round_up(sizes.max(), self.dataset.round_to)
+
+        # Series stored in lower precision are upcasted to float32 batches
+        out = self._empty_batch(batch[0], (len(batch), len(self.dataset.temporal_cols), max_size),
+                                dtype=torch.float32)
+        return _pack_padded(torch.cat(batch, dim=1), np.append(0, sizes.cumsum()), max_size, out)
+
+    def _collate_temporal(self, batch):
+        # Columns are attached once per batch, items only carry tensors
+        temporal = [d.temporal for d in batch]
+        return dict(temporal=self._pad_tensors(temporal),
+                    temporal_cols = self.dataset.temporal_cols)
+
+    def _collate_static(self, batch):
+        # Unzip temporal and static data in a single pass
+        temporal, static = zip(*batch)
+        return dict(static=self._stack_tensors(static),
+                    static_cols = self.dataset.static_cols,
+                    temporal=self._pad_tensors(temporal),
+                    temporal_cols = self.dataset.temporal_cols)
+
+    def _select_collate_fn(self, elem):
         elem_type = type(elem)
 
         if isinstance(elem, torch.Tensor):
-            out = None
-            if torch.utils.data.get_worker_info() is not None:
-                # If we're in a background process, concatenate directly into a
-                # shared memory tensor to avoid an extra copy
-                numel = sum(x.numel() for x in batch)
-                storage = elem.storage()._new_shared(numel, device=elem.device)
-                out = elem.new(storage).resize_(len(batch), *list(elem.size()))
-            return torch.stack(batch, 0, out=out)
-
-        elif isinstance(elem, Mapping):
-            if elem['static'] is None:
-                return dict(temporal=self.collate_fn([d['temporal'] for d in batch]),
-                            temporal_cols = elem['temporal_cols'])
-            
-            return dict(static=self.collate_fn([d['static'] for d in batch]),
-                        static_cols = elem['static_cols'],
-                        temporal=self.collate_fn([d['temporal'] for d in batch]),
-                        temporal_cols = elem['temporal_cols'])
+            return self._stack_tensors
+
+        elif isinstance(elem, _Sample):
+            if elem.static is None:
+                return self._collate_temporal
+            return self._collate_static
 
         raise TypeError(f'Unknown {elem_type}')
 
 # %% ../nbs/tsdataset.ipynb 7
+# Dataset items, pickled as plain tuples without per-item keys
+_Sample = namedtuple('_Sample', ['temporal', 'static'])
+
+def _round_up(size, round_to):
+    # Smallest multiple of round_to not below size
+    return int(((size + round_to - 1) // round_to) * round_to)
+
+def _pack_padded(temporal_T, indptr, max_size, out):
+    # Left-pad the series of temporal_T [C, n_data] delimited by indptr into
+    # out [n_groups, C, max_size], or [n_groups, C+1, max_size] with available_mask
+    n_groups = len(indptr) - 1
+    n_cols = len(temporal_T)
+    sizes = np.diff(indptr)
+
+    # Row n of group g lands in column max_size - size_g + (n - indptr[g])
+    rows = torch.as_tensor(np.repeat(np.arange(n_groups), sizes), dtype=torch.long)
+    cols = np.arange(indptr[-1]) - np.repeat(indptr[1:] - max_size, sizes)
+    cols = torch.as_tensor(cols, dtype=torch.long)
+    out.permute(1, 0, 2)[:n_cols, rows, cols] = temporal_T.to(out.dtype)
+
+    # Add available_mask, zero only the left padding of the data channels
+    available = torch.arange(max_size) >= torch.as_tensor(max_size - sizes)[:, None]
+    if out.shape[1] > n_cols:
+        out[:, n_cols, :] = available
+    out[:, :n_cols, :].masked_fill_(~available[:, None, :], 0)
+    return out
+
 class TimeSeriesDataset(Dataset):
 
     def __init__(self,
@@ -72,22 +136,37 @@ class TimeSeriesDataset(Dataset):
                  max_size,
                  static=None,
                  static_cols=None,
-                 sorted=False):
+                 sorted=False,
+                 round_to=1,
+                 with_mask=True,
+                 dtype=torch.float32):
         super().__init__()
 
-        self.temporal = torch.tensor(temporal, dtype=torch.float)
-        self.temporal_cols = pd.Index(list(temporal_cols)+\
-                                      ['available_mask'])
+        # Single channel-major buffer [C, n_data], each serie is contiguous within a channel.
+        # Zero-copy when temporal is already the transposed view of such a buffer
+        self.temporal_T = torch.as_tensor(temporal).to(dtype).t().contiguous()
+        # Row-major [n_data, C] view of the same storage
+        self.temporal = self.temporal_T.t()
+        # The available_mask channel is optional, built-in models require it
+        self.with_mask = with_mask
+        if with_mask:
+            self.temporal_cols = pd.Index(list(temporal_cols)+\
+                                          ['available_mask'])
+        else:
+            self.temporal_cols = pd.Index(list(temporal_cols))
         if static is not None:
-            self.static = torch.tensor(static, dtype=torch.float)
+            self.static = torch.as_tensor(static, dtype=torch.float32)
             self.static_cols = static_cols
         else:
             self.static = static
             self.static_cols = static_cols
 
-        self.indptr = indptr
-        self.n_groups = self.indptr.size - 1
-        self.max_size = max_size
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.sizes = np.diff(self.indptr)
+        self.n_groups = len(self.sizes)
+        # Round padded length up to a multiple of round_to
+        self.round_to = round_to
+        self.max_size = _round_up(max_size, round_to)
 
         # Upadated flag. To protect consistency, dataset can only be updated once
         self.updated = False
@@ -95,20 +174,13 @@ class TimeSeriesDataset(Dataset):
 
     def __getitem__(self, idx):
         if isinstance(idx, int):
-            # Parse temporal data and pad its left
-            temporal = torch.zeros(size=(len(self.temporal_cols), self.max_size),
-                                   dtype=torch.float32)
-            ts = self.temporal[self.indptr[idx] : self.indptr[idx + 1], :]
-            temporal[:len(self.temporal_cols)-1, -len(ts):] = ts.permute(1, 0)
-
-            # Add available_mask
-            temporal[len(self.temporal_cols)-1, -len(ts):] = 1
+            # Parse raw temporal data [C, size], TimeSeriesLoader pads its left
+            temporal = self.temporal_T[:, self.indptr[idx] : self.indptr[idx + 1]]
 
             # Add static data if available
             static = None if self.static is None else self.static[idx,:]
 
-            item = dict(temporal=temporal, temporal_cols=self.temporal_cols,
-                        static=static, static_cols=self.static_cols)
+            item = _Sample(temporal=temporal, static=static)
 
             return item
         raise ValueError(f'idx must be int, got {type(idx)}')
@@ -131,7 +203,8 @@ class TimeSeriesDataset(Dataset):
 
         # Add Nones to missing columns (without available_mask)
         temporal_cols = dataset.temporal_cols.copy()
-        temporal_cols = temporal_cols.delete(len(temporal_cols)-1)
+        if dataset.with_mask:
+            temporal_cols = temporal_cols.delete(len(temporal_cols)-1)
         for col in temporal_cols:
             if col not in future_df.columns:
                 future_df[col] = None
@@ -140,48 +213,55 @@ class TimeSeriesDataset(Dataset):
         future_df = future_df[ ['unique_id','ds'] + temporal_cols.tolist() ]
 
         # Process future_df
-        futr_dataset, indices, futr_dates, futr_index = dataset.from_df(df=future_df, sort_df=dataset.sorted)
-
-        # Define and fill new temporal with updated information
-        len_temporal, col_temporal = dataset.temporal.shape
-        new_temporal = torch.zeros(size=(len_temporal+len(future_df), col_temporal))
-        new_indptr = [0]
-        new_max_size = 0
-
-        acum = 0
-        for i in range(dataset.n_groups):
-            series_length = dataset.indptr[i + 1] - dataset.indptr[i]
-            new_length = series_length + futr_dataset.indptr[i + 1] - futr_dataset.indptr[i]
-            new_temporal[acum:(acum+series_length), :] = dataset.temporal[dataset.indptr[i] : dataset.indptr[i + 1], :]
-            new_temporal[(acum+series_length):(acum+new_length), :] = \
-                                 futr_dataset.temporal[futr_dataset.indptr[i] : futr_dataset.indptr[i + 1], :]
-            
-            acum += new_length
-            new_indptr.append(acum)
-            if new_length > new_max_size:
-                new_max_size = new_length
-        
-        # Define new dataset
-        updated_dataset = TimeSeriesDataset(temporal=new_temporal,
+        futr_dataset, indices, futr_dates, futr_index = dataset.from_df(df=future_df, sort_df=dataset.sorted,
+                                                                        dtype=dataset.temporal.dtype)
+
+        # Define new indptr, each serie is followed by its future observations
+        hist_sizes = dataset.sizes
+        futr_sizes = futr_dataset.sizes
+        new_sizes = hist_sizes + futr_sizes
+        new_indptr = np.append(0, new_sizes.cumsum())
+        new_max_size = int(new_sizes.max())
+
+        # Destination rows: historic rows shift by the future rows of previous series,
+        # future rows shift by the historic rows up to their own serie
+        hist_idx = np.arange(len(dataset.temporal)) + np.repeat(futr_dataset.indptr[:-1], hist_sizes)
+        futr_idx = np.arange(len(futr_dataset.temporal)) + np.repeat(dataset.indptr[1:], futr_sizes)
+        dest_idx = torch.as_tensor(np.concatenate([hist_idx, futr_idx]), dtype=torch.long)
+
+        # Define and fill new channel-major temporal with updated information
+        col_temporal, len_temporal = dataset.temporal_T.shape
+        new_temporal_T = torch.empty(size=(col_temporal, len_temporal+len(future_df)),
+                                     dtype=dataset.temporal.dtype)
+        new_temporal_T.index_copy_(1, dest_idx, torch.cat([dataset.temporal_T, futr_dataset.temporal_T], dim=1))
+
+        # Define new dataset, sharing new_temporal_T storage
+        updated_dataset = TimeSeriesDataset(temporal=new_temporal_T.t(),
                                             temporal_cols=temporal_cols,
-                                            indptr=np.array(new_indptr).astype(np.int32),
+                                            indptr=new_indptr,
                                             max_size=new_max_size,
                                             static=dataset.static,
                                             static_cols=dataset.static_cols,
-                                            sorted=dataset.sorted)
+                                            sorted=dataset.sorted,
+                                            round_to=dataset.round_to,
+                                            with_mask=dataset.with_mask,
+                                            dtype=dataset.temporal.dtype)
 
         return updated_dataset
 
     @staticmethod
-    def from_df(df, static_df=None, sort_df=False):
+    def from_df(df, static_df=None, sort_df=False, round_to=1, with_mask=True, dtype=torch.float32):
         # TODO: protect on equality of static_df + df indexes
-        # Define indexes if not given
-        if df.index.name != 'unique_id':
-            df = df.set_index('unique_id')
-            if static_df is not None:
-                static_df = static_df.set_index('unique_id')
-
-        df = df.set_index('ds', append=True)
+        # Define indexes if not given, frames indexed by [unique_id, ds] are used as is
+        if list(df.index.names) != ['unique_id', 'ds']:
+            if df.index.name != 'unique_id':
+                df = df.set_index('unique_id')
+                if static_df is not None:
+                    static_df = static_df.set_index('unique_id')
+
+            df = df.set_index('ds', append=True)
+        elif static_df is not None and static_df.index.name != 'unique_id':
+            static_df = static_df.set_index('unique_id')
         
         # Sort data by index
         if not df.index.is_monotonic_increasing and sort_df:
@@ -193,13 +273,15 @@ class TimeSeriesDataset(Dataset):
         # Create auxiliary temporal indices 'indptr'
         temporal = df.values.astype(np.float32)
         temporal_cols = df.columns
-        indices_sizes = df.index.get_level_values('unique_id').value_counts(sort=False)
-        indices = indices_sizes.index
-        sizes = indices_sizes.values
-        max_size = max(sizes)
+        # Serie sizes from the index codes, in order of appearance
+        uid_codes = df.index.codes[0]
+        uid_order = pd.unique(uid_codes)
+        indices = df.index.levels[0].take(uid_order)
+        sizes = np.bincount(uid_codes, minlength=len(df.index.levels[0]))[uid_order]
+        max_size = int(sizes.max())
         cum_sizes = sizes.cumsum()
-        dates = df.index.get_level_values('ds')[cum_sizes - 1]
-        indptr = np.append(0, cum_sizes).astype(np.int32)
+        dates = df.index.levels[1].take(df.index.codes[1][cum_sizes - 1])
+        indptr = np.append(0, cum_sizes)
 
         # Static features
         if static_df is not None:
@@ -212,10 +294,54 @@ class TimeSeriesDataset(Dataset):
         dataset = TimeSeriesDataset(
                     temporal=temporal, temporal_cols=temporal_cols,
                     static=static, static_cols=static_cols,
-                    indptr=indptr, max_size=max_size, sorted=sort_df)
+                    indptr=indptr, max_size=max_size, sorted=sort_df,
+                    round_to=round_to, with_mask=with_mask, dtype=dtype)
         return dataset, indices, dates, df.index
 
 # %% ../nbs/tsdataset.ipynb 10
+class LengthBucketSampler(Sampler):
+    """LengthBucketSampler Batch Sampler.
+
+    Groups series of similar length into the same batch, so that batches padded
+    up to their longest serie carry less padding than with uniform sampling.
+    Series are sorted by size, chunked into batches and the batch order is shuffled.
+
+    **Parameters:**<br>
+    `sizes`: (np.ndarray): number of observations of each serie, see `TimeSeriesDataset.sizes`.<br>
+    `batch_size`: (int): how many series per batch to load.<br>
+    `shuffle`: (bool, optional): set to `True` to break size ties and reshuffle the batches at every epoch (default: `True`).<br>
+    `drop_last`: (bool, optional): set to `True` to drop the last incomplete batch (default: `False`).<br>
+    """
+    def __init__(self, sizes, batch_size, shuffle=True, drop_last=False):
+        self.sizes = np.asarray(sizes)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+    def __iter__(self):
+        # Sort series by size, random permutation breaks ties between equal sizes
+        if self.shuffle:
+            perm = torch.randperm(len(self.sizes)).numpy()
+            order = perm[np.argsort(self.sizes[perm], kind='stable')]
+        else:
+            order = np.argsort(self.sizes, kind='stable')
+
+        batches = [order[i : i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        if self.drop_last and len(batches) > 0 and len(batches[-1]) < self.batch_size:
+            batches = batches[:-1]
+
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches)).tolist()]
+
+        for batch in batches:
+            yield batch.tolist()
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.sizes) // self.batch_size
+        return (len(self.sizes) + self.batch_size - 1) // self.batch_size
+
+# %% ../nbs/tsdataset.ipynb 12
 class TimeSeriesDataModule(pl.LightningDataModule):
     
     def __init__(
@@ -223,21 +349,56 @@ class TimeSeriesDataModule(pl.LightningDataModule):
             dataset: TimeSeriesDataset,
             batch_size=32, 
             num_workers=0,
-            drop_last=False
+            drop_last=False,
+            pin_memory=False,
+            prefetch_factor=2,
+            persistent_workers=None,
+            bucket_by_length=False
         ):
         super().__init__()
         self.dataset = dataset
         self.batch_size = batch_size
         self.num_workers = num_workers
         self.drop_last = drop_last
+        self.pin_memory = pin_memory
+        self.prefetch_factor = prefetch_factor
+        self.persistent_workers = persistent_workers
+        self.bucket_by_length = bucket_by_length
+
+    def _loader_kwargs(self, persistent_workers=False):
+        # Training and validation keep their workers alive across epochs by default,
+        # prediction does not to avoid leaking workers across predict calls.
+        # Prefetch and persistence are only valid with workers
+        kwargs = dict(num_workers=self.num_workers, pin_memory=self.pin_memory)
+        if self.num_workers > 0:
+            if self.persistent_workers is not None:
+                persistent_workers = self.persistent_workers
+            kwargs.update(persistent_workers=persistent_workers,
+                          prefetch_factor=self.prefetch_factor)
+        return kwargs
     
     def train_dataloader(self):
+        if self.bucket_by_length:
+            batch_sampler = LengthBucketSampler(
+                self.dataset.sizes,
+                batch_size=self.batch_size,
+                shuffle=True,
+                drop_last=self.drop_last
+            )
+            loader = TimeSeriesLoader(
+                self.dataset,
+                batch_sampler=batch_sampler,
+                pad_to_batch_max=True,
+                **self._loader_kwargs(persistent_workers=True)
+            )
+            return loader
+
         loader = TimeSeriesLoader(
             self.dataset, 
             batch_size=self.batch_size, 
-            num_workers=self.num_workers,
             shuffle=True,
-            drop_last=self.drop_last
+            drop_last=self.drop_last,
+            **self._loader_kwargs(persistent_workers=True)
         )
         return loader
     
@@ -245,9 +406,9 @@ class TimeSeriesDataModule(pl.LightningDataModule):
         loader = TimeSeriesLoader(
             self.dataset, 
             batch_size=self.batch_size, 
-            num_workers=self.num_workers,
             shuffle=False,
-            drop_last=self.drop_last
+            drop_last=self.drop_last,
+            **self._loader_kwargs(persistent_workers=True)
         )
         return loader
     
@@ -255,7 +416,7 @@ class TimeSeriesDataModule(pl.LightningDataModule):
         loader = TimeSeriesLoader(
             self.dataset,
             batch_size=self.batch_size, 
-            num_workers=self.num_workers,
-            shuffle=False
+            shuffle=False,
+            **self._loader_kwargs()
         )
         return loader